@@ -1,7 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 
+# Copy-on-Write: le colonne estratte condividono i dati invece di copiarli (predefinito da pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 # Configurazione pagina
 st.set_page_config(
     page_title="Excel Data Filter",
@@ -165,15 +170,86 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Funzioni helper
-@st.cache_data
-def load_excel_data(file_path):
-    """Carica i dati dal file Excel"""
+@st.cache_data(max_entries=1)
+def load_excel_data(file_path, file_version=None, downcast=False):
+    """Carica i dati dal file Excel, con riduzione opzionale dei tipi (file_version invalida la cache)"""
     try:
         df = pd.read_excel(file_path, engine='openpyxl')
-        return df
     except Exception as e:
         st.error(f"Errore nel caricamento del file: {e}")
-        return None
+        return None, None
+    
+    if not downcast:
+        return df, None
+    
+    memory_before = int(df.memory_usage(deep=True).sum())
+    df = downcast_dtypes(df)
+    memory_after = int(df.memory_usage(deep=True).sum())
+    return df, {'before': memory_before, 'after': memory_after}
+
+def downcast_column(series):
+    """Riduce il tipo di una colonna senza alterare i valori visualizzati né i filtri"""
+    col_name = series.name
+    
+    # Interi: int16/int32 se il range lo consente
+    if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        for target in (np.int16, np.int32):
+            info = np.iinfo(target)
+            if series.empty or (series.min() >= info.min and series.max() <= info.max):
+                return series.astype(target)
+        return series
+    
+    # Decimali: float32 solo se visualizzazione e confronti a due decimali restano identici
+    if pd.api.types.is_float_dtype(series) and series.dtype == np.float64:
+        values = series.to_numpy()
+        values32 = values.astype(np.float32)
+        if np.isinf(values32[np.isfinite(values)]).any():
+            return series
+        
+        # Un valore coincide con una soglia a due decimali prima e dopo la conversione
+        thresholds = np.round(values, 2)
+        if not np.array_equal(values == thresholds, values32 == thresholds.astype(np.float32)):
+            return series
+        
+        # Valori la cui visualizzazione può cambiare: tutti quelli modificati se la colonna
+        # mostra il valore grezzo, altrimenti solo quelli vicini a un confine di arrotondamento
+        roundtrip = values32.astype(np.float64)
+        finite = np.isfinite(values)
+        if format_value(DISPLAY_PROBE, col_name) == str(DISPLAY_PROBE):
+            candidates = finite & (roundtrip != values)
+        else:
+            # I formati numerici (interi, due decimali, percentuali intere) cambiano solo
+            # attraversando un multiplo di 0.005: basta cercare quei multipli nell'intervallo
+            low = np.minimum(values, roundtrip) * 200
+            high = np.maximum(values, roundtrip) * 200
+            candidates = finite & (np.floor(low - 1e-3) != np.floor(high + 1e-3))
+        
+        for original, converted in zip(values[candidates], roundtrip[candidates]):
+            if format_value(original, col_name) != format_value(converted, col_name):
+                return series
+        return pd.Series(values32, index=series.index, name=col_name)
+    
+    # Testo: categoria se i valori sono solo stringhe e poco variabili
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            return series
+        non_null = series.count()
+        if non_null and series.nunique() <= non_null // 2:
+            return series.astype('category')
+    
+    return series
+
+def downcast_dtypes(df):
+    """Applica downcast_column a tutte le colonne del dataframe"""
+    return pd.DataFrame({col: downcast_column(df[col]) for col in df.columns}, index=df.index)
+
+def format_bytes(num_bytes):
+    """Formatta una dimensione in byte in forma leggibile"""
+    for unit in ['B', 'KB', 'MB']:
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
 
 def get_column_type(df, col_name):
     """Determina se una colonna è numerica o testuale"""
@@ -298,46 +374,45 @@ def get_column_width(col_name):
     return 100
 
 def apply_single_filter(df, col_name, condition, value):
-    """Applica un singolo filtro al dataframe"""
+    """Restituisce la maschera booleana delle righe che soddisfano un singolo filtro"""
+    all_rows = np.ones(len(df), dtype=bool)
     if df.empty:
-        return df
+        return all_rows
     
+    series = df[col_name]
     col_type = get_column_type(df, col_name)
     
     if col_type == 'number':
         try:
             num_value = float(value)
             if condition == '>':
-                return df[df[col_name] > num_value]
+                return (series > num_value).to_numpy(dtype=bool, na_value=False)
             elif condition == '<':
-                return df[df[col_name] < num_value]
+                return (series < num_value).to_numpy(dtype=bool, na_value=False)
             elif condition == '>=':
-                return df[df[col_name] >= num_value]
+                return (series >= num_value).to_numpy(dtype=bool, na_value=False)
             elif condition == '<=':
-                return df[df[col_name] <= num_value]
+                return (series <= num_value).to_numpy(dtype=bool, na_value=False)
             elif condition == '=':
-                return df[df[col_name] == num_value]
+                return (series == num_value).to_numpy(dtype=bool, na_value=False)
         except:
-            return df
+            return all_rows
     else:
         if condition == 'in':
             # Assicura che i valori del filtro siano stringhe se la colonna è di tipo object/string
-            if df[col_name].dtype == 'object':
+            if series.dtype == 'object':
                 value = [str(v) for v in value]
-            return df[df[col_name].isin(value)]
+            return series.isin(value).to_numpy(dtype=bool, na_value=False)
         elif condition == 'not_in':
-            if df[col_name].dtype == 'object':
+            if series.dtype == 'object':
                 value = [str(v) for v in value]
-            return df[~df[col_name].isin(value)]
+            return (~series.isin(value)).to_numpy(dtype=bool, na_value=False)
     
-    return df
+    return all_rows
 
 
 def apply_filter_group(df, filters, group_logic):
-    """Applica un gruppo di filtri con la logica interna specificata"""
-    if not filters:
-        return df
-    
+    """Restituisce la maschera di un gruppo di filtri con la logica interna specificata"""
     results = []
     for filter_config in filters:
         col_name = filter_config.get('column')
@@ -347,27 +422,250 @@ def apply_filter_group(df, filters, group_logic):
         if col_name and condition and value is not None:
             if isinstance(value, list) and len(value) == 0:
                 continue
-            filtered = apply_single_filter(df, col_name, condition, value)
-            results.append(set(filtered.index))
+            results.append(apply_single_filter(df, col_name, condition, value))
     
     if not results:
-        return df
+        return np.ones(len(df), dtype=bool)
     
     if group_logic == 'AND':
-        final_indices = set.intersection(*results)
+        return np.logical_and.reduce(results)
+    else:  # OR
+        return np.logical_or.reduce(results)
+
+def apply_filter_groups(df, filter_groups, global_logic):
+    """Restituisce la maschera complessiva dei gruppi di filtri combinati con la logica globale"""
+    group_results = [
+        apply_filter_group(df, group['filters'], group['logic'])
+        for group in filter_groups
+    ]
+    
+    if not group_results:
+        return np.ones(len(df), dtype=bool)
+    
+    if global_logic == 'AND':
+        return np.logical_and.reduce(group_results)
     else:  # OR
-        final_indices = set.union(*results)
+        return np.logical_or.reduce(group_results)
+
+def project_columns(df, col_names):
+    """Seleziona le colonne indicate senza copiarne i dati"""
+    # df[lista] copia le colonne non adiacenti di un blocco consolidato;
+    # concatenare le singole Series (viste con Copy-on-Write) evita la copia
+    return pd.concat([df[col] for col in col_names], axis=1)
+
+def get_required_columns(df, filter_groups, display_columns, ranking):
+    """Restituisce, nell'ordine del file, le sole colonne usate da filtri, classifica e visualizzazione"""
+    required = set(display_columns)
+    
+    for group in filter_groups:
+        for filter_config in group['filters']:
+            if filter_config.get('column'):
+                required.add(filter_config['column'])
+    
+    if ranking['enabled']:
+        if ranking['column'] == COMPOSITE_OPTION:
+            required.update(ranking['weights'])
+        elif ranking['column']:
+            required.add(ranking['column'])
+    
+    return [col for col in df.columns if col in required]
+
+def compute_composite_score(df, weights):
+    """Calcola un punteggio composito come somma pesata delle colonne indicate
+    
+    Una riga con un valore mancante in una delle colonne ha punteggio NaN: non viene
+    trattato come zero, quindi la riga resta fuori dalla classifica (e viene conteggiata)
+    """
+    score = np.zeros(len(df), dtype=np.float64)
+    for col_name, weight in weights.items():
+        score += weight * df[col_name].to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.Series(score, index=df.index, name=COMPOSITE_SCORE_COLUMN)
+
+def rank_top_n(df, scores, n, direction):
+    """Restituisce le prime n righe per punteggio usando una selezione parziale"""
+    values = np.asarray(scores, dtype=np.float64)
+    if direction == 'abs':
+        values = np.abs(values)
+    
+    # argpartition seleziona i minimi: per i massimi si inverte il segno
+    keys = values if direction == 'asc' else -values
+    valid = np.flatnonzero(~np.isnan(keys))
+    
+    if n <= 0 or valid.size == 0:
+        return df.iloc[0:0]
+    
+    keys = keys[valid]
+    if n < valid.size:
+        # Valore dell'n-esima posizione: prima tutte le righe migliori, poi i pari merito
+        # nell'ordine originale, come in un ordinamento stabile completo
+        cutoff = np.partition(keys, n - 1)[n - 1]
+        better = np.flatnonzero(keys < cutoff)
+        ties = np.flatnonzero(keys == cutoff)[:n - better.size]
+        top = np.concatenate([better, ties])
+    else:
+        top = np.arange(valid.size)
+    
+    # Ordina solo le n righe selezionate (a parità di punteggio vale l'ordine originale)
+    top = top[np.lexsort((top, keys[top]))]
+    return df.iloc[valid[top]]
+
+def get_file_version(file_path):
+    """Identifica la versione del file tramite data di modifica e dimensione"""
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def snapshot_frame(df):
+    """Prepara i dati per il formato colonnare: le colonne con numeri e testo mescolati diventano testo"""
+    mixed = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_object_dtype(series) and pd.api.types.infer_dtype(series, skipna=True).startswith('mixed'):
+            mixed[col] = series.where(series.isna(), series.astype(str))
+    return df.assign(**mixed) if mixed else df
+
+@st.cache_resource
+def update_snapshots(file_version, _df):
+    """Salva la versione corrente in formato colonnare spostando la precedente (una volta per versione)"""
+    current_path = os.path.join(SNAPSHOT_DIR, 'current.parquet')
+    current_version_path = os.path.join(SNAPSHOT_DIR, 'current.version')
+    previous_path = os.path.join(SNAPSHOT_DIR, 'previous.parquet')
+    previous_version_path = os.path.join(SNAPSHOT_DIR, 'previous.version')
+    
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        
+        stored_version = None
+        if os.path.exists(current_version_path):
+            with open(current_version_path) as f:
+                stored_version = f.read().strip()
+        
+        if stored_version != file_version:
+            if stored_version is not None and os.path.exists(current_path):
+                os.replace(current_path, previous_path)
+                os.replace(current_version_path, previous_version_path)
+            snapshot_frame(_df).to_parquet(current_path)
+            with open(current_version_path, 'w') as f:
+                f.write(file_version)
+    except (OSError, ValueError, TypeError, ImportError) as e:
+        st.warning(f"Impossibile salvare lo snapshot dei dati: {e}")
+        return None
+    
+    if not os.path.exists(previous_path) or not os.path.exists(previous_version_path):
+        return None
     
-    return df.loc[list(final_indices)]
+    with open(previous_version_path) as f:
+        return f.read().strip()
+
+@st.cache_data(max_entries=1)
+def load_snapshot(snapshot_version):
+    """Carica la versione precedente dei dati dallo snapshot colonnare"""
+    try:
+        return pd.read_parquet(os.path.join(SNAPSHOT_DIR, 'previous.parquet'))
+    except (OSError, ValueError, ImportError) as e:
+        st.error(f"Errore nel caricamento della versione precedente: {e}")
+        return None
+
+def ambiguous_key_mask(df):
+    """Righe senza chiave o con chiave Div + Nome Mercato ripetuta, non confrontabili tra versioni"""
+    missing = df[SNAPSHOT_KEYS].isna().any(axis=1)
+    duplicated = df.duplicated(subset=SNAPSHOT_KEYS, keep=False)
+    return (missing | duplicated).to_numpy()
+
+def compute_snapshot_diff(df_previous, df_current, filter_groups, global_logic, value_columns):
+    """Confronta due versioni dei dati per chiave Div + Nome Mercato (escluse le chiavi ambigue)"""
+    previous = df_previous[~ambiguous_key_mask(df_previous)]
+    current = df_current[~ambiguous_key_mask(df_current)]
+    
+    # Stato dei filtri calcolato con lo stesso motore dei risultati
+    previous = previous.assign(**{DIFF_MATCH: apply_filter_groups(previous, filter_groups, global_logic)})
+    current = current.assign(**{DIFF_MATCH: apply_filter_groups(current, filter_groups, global_logic)})
+    
+    # Chiavi categoriche con le stesse categorie: il join avviene sui codici
+    for key in SNAPSHOT_KEYS:
+        categories = pd.api.types.union_categoricals(
+            [previous[key].astype(str).astype('category'), current[key].astype(str).astype('category')]
+        ).categories
+        previous = previous.assign(**{key: pd.Categorical(previous[key].astype(str), categories=categories)})
+        current = current.assign(**{key: pd.Categorical(current[key].astype(str), categories=categories)})
+    
+    compared_columns = SNAPSHOT_KEYS + value_columns + [DIFF_MATCH]
+    merged = previous[compared_columns].merge(
+        current[compared_columns],
+        on=SNAPSHOT_KEYS,
+        how='outer',
+        suffixes=(DIFF_PREVIOUS, DIFF_CURRENT),
+        indicator=True
+    )
+    
+    added = (merged['_merge'] == 'right_only').to_numpy()
+    removed = (merged['_merge'] == 'left_only').to_numpy()
+    both = (merged['_merge'] == 'both').to_numpy()
+    match_previous = merged[DIFF_MATCH + DIFF_PREVIOUS].to_numpy(dtype=bool, na_value=False)
+    match_current = merged[DIFF_MATCH + DIFF_CURRENT].to_numpy(dtype=bool, na_value=False)
+    
+    result = merged[SNAPSHOT_KEYS].copy()
+    changed_any = np.zeros(len(merged), dtype=bool)
+    changed_labels = np.full(len(merged), '', dtype=object)
+    
+    for col in value_columns:
+        previous_values = merged[col + DIFF_PREVIOUS]
+        current_values = merged[col + DIFF_CURRENT]
+        
+        if get_column_type(merged, col + DIFF_PREVIOUS) == 'number' and get_column_type(merged, col + DIFF_CURRENT) == 'number':
+            # Confronto alla precisione di visualizzazione (due decimali)
+            a = np.round(previous_values.to_numpy(dtype=np.float64, na_value=np.nan), 2)
+            b = np.round(current_values.to_numpy(dtype=np.float64, na_value=np.nan), 2)
+            changed = both & ~((a == b) | (np.isnan(a) & np.isnan(b)))
+            result[col] = current_values.where(~removed, previous_values)
+        else:
+            a = previous_values.astype(object)
+            b = current_values.astype(object)
+            changed = both & ~(a.eq(b) | (a.isna() & b.isna())).to_numpy()
+            result[col] = b.where(~removed, a)
+        
+        changed_any |= changed
+        changed_labels = changed_labels + np.where(changed, col + ', ', '')
+    
+    # Condizioni nello stesso ordine di DIFF_STATUSES; l'ultimo stato è quello predefinito
+    result.insert(len(SNAPSHOT_KEYS), 'Variazione', np.select(
+        [added, removed, both & ~match_previous & match_current, both & match_previous & ~match_current, changed_any],
+        DIFF_STATUSES[:-1],
+        default=DIFF_STATUSES[-1]
+    ))
+    result.insert(len(SNAPSHOT_KEYS) + 1, 'Colonne modificate', pd.Series(changed_labels, index=result.index).str.rstrip(', '))
+    result.insert(len(SNAPSHOT_KEYS) + 2, 'Nei filtri (prec.)', np.where(added, None, match_previous))
+    result.insert(len(SNAPSHOT_KEYS) + 3, 'Nei filtri', np.where(removed, None, match_current))
+    return result
 
 def reset_all_filters():
     """Resetta completamente tutti i filtri e lo stato"""
     st.session_state.filter_groups = []
     st.session_state.group_counter = 0
     st.session_state.global_logic = 'AND'
+    st.session_state.ranking = default_ranking()
+    for key in [key for key in st.session_state if str(key).startswith('ranking_')]:
+        del st.session_state[key]
     if 'selected_columns' in st.session_state:
         del st.session_state.selected_columns
 
+def seed_ranking_widget(key, value, valid=None, fallback=None):
+    """Inizializza lo stato di un widget della classifica senza sovrascrivere le modifiche dell'utente"""
+    if key not in st.session_state:
+        st.session_state[key] = value
+    if valid is not None and not valid(st.session_state[key]):
+        st.session_state[key] = fallback
+
+def default_ranking():
+    """Configurazione iniziale della classifica Top-N"""
+    return {
+        'enabled': False,
+        'column': None,
+        'direction': 'desc',
+        'n': 50,
+        'within_filter': True,
+        'weights': {}
+    }
+
 # Inizializzazione session state (PERSISTENTE - sopravvive ai refresh)
 if 'filter_groups' not in st.session_state:
     st.session_state.filter_groups = []
@@ -378,16 +676,38 @@ if 'group_counter' not in st.session_state:
 if 'global_logic' not in st.session_state:
     st.session_state.global_logic = 'AND'
 
+if 'ranking' not in st.session_state:
+    st.session_state.ranking = default_ranking()
+
 # Caricamento dati
 DATA_FILE = 'data.xlsx'
 
+# Riduzione dei tipi al caricamento (float32, int16/int32, categorie)
+DOWNCAST_DTYPES = True
+
+# Valore di prova per riconoscere le colonne visualizzate senza arrotondamento
+DISPLAY_PROBE = 0.123456789
+
+# Snapshot per il confronto tra versioni
+SNAPSHOT_DIR = '.snapshots'
+SNAPSHOT_KEYS = ['Div', 'Nome Mercato']
+DIFF_MATCH = '__match'
+DIFF_PREVIOUS = '__prev'
+DIFF_CURRENT = '__curr'
+DIFF_STATUSES = ['Nuova', 'Rimossa', 'Entrata nel filtro', 'Uscita dal filtro', 'Valori modificati', 'Invariata']
+
+# Classifica Top-N
+COMPOSITE_SCORE_COLUMN = 'Punteggio Composito'
+COMPOSITE_OPTION = '__composite__'
+
 if not os.path.exists(DATA_FILE):
     # --- MODIFICA QUI ---
     st.error(f"File '{DATA_FILE}' non trovato nella directory corrente!")
     st.info("Assicurati che il file 'data.xlsx' sia presente nella root del progetto.")
     st.stop()
 
-df_original = load_excel_data(DATA_FILE)
+data_version = get_file_version(DATA_FILE)
+df_original, memory_report = load_excel_data(DATA_FILE, data_version, downcast=DOWNCAST_DTYPES)
 
 if df_original is None or df_original.empty:
     st.error("Impossibile caricare i dati dal file Excel.")
@@ -395,9 +715,18 @@ if df_original is None or df_original.empty:
 
 columns = df_original.columns.tolist()
 
+previous_version = update_snapshots(data_version, df_original)
+
 # ============= SIDEBAR =============
 st.sidebar.title("📊 Pannello di Controllo")
 
+if memory_report:
+    saved = memory_report['before'] - memory_report['after']
+    st.sidebar.caption(
+        f"💾 Memoria dati: {format_bytes(memory_report['after'])} "
+        f"(risparmiati {format_bytes(saved)} su {format_bytes(memory_report['before'])})"
+    )
+
 # LEGENDA
 with st.sidebar.expander("📖 Legenda Indicatori", expanded=False):
     st.markdown("""
@@ -662,38 +991,161 @@ for group_idx in reversed(groups_to_remove):
     st.session_state.filter_groups.pop(group_idx)
     st.rerun()
 
+st.sidebar.markdown("---")
+
+# Classifica Top-N
+st.sidebar.header("3️⃣ Classifica Top-N")
+
+ranking = st.session_state.ranking
+numeric_columns = [col for col in columns if get_column_type(df_original, col) == 'number']
+zscore_columns = [col for col in numeric_columns if 'Z-Score' in col or col.startswith('ZS')]
+
+# Widget con chiave stabile: il valore iniziale arriva dalla configurazione salvata
+seed_ranking_widget('ranking_enabled', ranking['enabled'])
+ranking['enabled'] = st.sidebar.checkbox(
+    "Mostra solo le prime N righe",
+    key='ranking_enabled',
+    help="Ordina per una colonna o per un punteggio composito e mostra solo le prime N righe"
+)
+
+if ranking['enabled'] and numeric_columns:
+    sort_options = numeric_columns + ([COMPOSITE_OPTION] if zscore_columns else [])
+    seed_ranking_widget('ranking_column', ranking['column'], valid=lambda x: x in sort_options, fallback=sort_options[0])
+    ranking['column'] = st.sidebar.selectbox(
+        "Ordina per:",
+        options=sort_options,
+        format_func=lambda x: "Punteggio composito (Z-Score pesati)" if x == COMPOSITE_OPTION else x,
+        key='ranking_column'
+    )
+    
+    if ranking['column'] == COMPOSITE_OPTION:
+        seed_ranking_widget(
+            'ranking_weighted_columns',
+            [col for col in ranking['weights'] if col in zscore_columns],
+            valid=lambda x: all(col in zscore_columns for col in x),
+            fallback=[]
+        )
+        weighted_columns = st.sidebar.multiselect(
+            "Colonne Z-Score:",
+            options=zscore_columns,
+            key='ranking_weighted_columns',
+            help="Il punteggio è la somma delle colonne moltiplicate per il rispettivo peso"
+        )
+        weights = {}
+        for col in weighted_columns:
+            seed_ranking_widget(f"ranking_weight_{col}", float(ranking['weights'].get(col, 1.0)))
+            weights[col] = st.sidebar.number_input(
+                f"Peso {col}:",
+                key=f"ranking_weight_{col}",
+                step=0.1
+            )
+        ranking['weights'] = weights
+    
+    directions = {
+        'desc': 'valori più alti',
+        'asc': 'valori più bassi',
+        'abs': 'valori più estremi (|x|)'
+    }
+    seed_ranking_widget('ranking_direction', ranking['direction'], valid=lambda x: x in directions, fallback='desc')
+    ranking['direction'] = st.sidebar.radio(
+        "Direzione:",
+        options=list(directions.keys()),
+        format_func=lambda x: directions[x],
+        key='ranking_direction'
+    )
+    
+    seed_ranking_widget('ranking_n', int(ranking['n']))
+    ranking['n'] = int(st.sidebar.number_input(
+        "Numero di righe (N):",
+        min_value=1,
+        step=10,
+        key='ranking_n'
+    ))
+    
+    seed_ranking_widget('ranking_within_filter', ranking['within_filter'])
+    ranking['within_filter'] = st.sidebar.checkbox(
+        "Solo tra i risultati filtrati",
+        key='ranking_within_filter',
+        help="Se disattivato la classifica considera tutte le righe del file"
+    )
+
 # ============= AREA PRINCIPALE =============
 st.title("📊 Filtro Avanzato Dati Excel")
 
 st.info("💡 **I filtri rimangono attivi anche dopo il refresh della pagina.** Usa il pulsante 'Reset Filtri' per azzerarli completamente.")
 
-# Applica filtri
-df_filtered = df_original.copy()
+display_columns = list(selected_columns) if selected_columns else list(columns)
+ranking = st.session_state.ranking
+
+# Proietta solo le colonne necessarie, senza copiarne i dati
+required_columns = get_required_columns(
+    df_original,
+    st.session_state.filter_groups,
+    display_columns,
+    ranking
+)
+df_work = project_columns(df_original, required_columns)
 
+# Applica filtri
 if st.session_state.filter_groups:
-    group_results = []
-    
-    for group in st.session_state.filter_groups:
-        group_filtered = apply_filter_group(
-            df_original,
-            group['filters'],
-            group['logic']
+    mask = apply_filter_groups(
+        df_work,
+        st.session_state.filter_groups,
+        st.session_state.global_logic
+    )
+    df_filtered = df_work[mask]
+else:
+    df_filtered = df_work
+
+# Applica classifica Top-N (solo le prime N righe vengono formattate)
+ranking_label = None
+ranking_excluded = 0
+
+if ranking['enabled'] and ranking['column']:
+    df_ranking_source = df_filtered if ranking['within_filter'] else df_work
+    
+    if ranking['column'] == COMPOSITE_OPTION:
+        if ranking['weights'] and not df_ranking_source.empty:
+            scores = compute_composite_score(df_ranking_source, ranking['weights'])
+            ranking_excluded = int(scores.isna().sum())
+            df_filtered = rank_top_n(
+                df_ranking_source.assign(**{COMPOSITE_SCORE_COLUMN: scores}),
+                scores,
+                ranking['n'],
+                ranking['direction']
+            )
+            display_columns = [COMPOSITE_SCORE_COLUMN] + display_columns
+            ranking_label = "punteggio composito"
+    elif not df_ranking_source.empty:
+        scores = df_ranking_source[ranking['column']].to_numpy(dtype=np.float64, na_value=np.nan)
+        ranking_excluded = int(np.isnan(scores).sum())
+        df_filtered = rank_top_n(
+            df_ranking_source,
+            scores,
+            ranking['n'],
+            ranking['direction']
         )
-        group_results.append(set(group_filtered.index))
-    
-    if group_results:
-        if st.session_state.global_logic == 'AND':
-            final_indices = set.intersection(*group_results) if group_results else set()
-        else:  # OR
-            final_indices = set.union(*group_results) if group_results else set()
-        
-        df_filtered = df_original.loc[list(final_indices)] if final_indices else pd.DataFrame()
+        ranking_label = ranking['column']
 
-# Applica selezione colonne
-if selected_columns:
-    df_display = df_filtered[selected_columns]
-else:
-    df_display = df_filtered
+# Riordina colonne: bloccate all'inizio
+pinned_cols = []
+other_cols = []
+
+if 'Div' in display_columns:
+    pinned_cols.append('Div')
+if 'Nome Mercato' in display_columns:
+    pinned_cols.append('Nome Mercato')
+if 'Frequenza Storica' in display_columns:
+    pinned_cols.append('Frequenza Storica')
+
+for col in display_columns:
+    if col not in pinned_cols:
+        other_cols.append(col)
+
+column_order = pinned_cols + other_cols
+
+# Applica selezione colonne (unica proiezione finale)
+df_display = df_filtered[column_order]
 
 # Visualizza risultati
 st.subheader("📋 Risultati")
@@ -706,31 +1158,18 @@ else:
 
 st.info(f"Visualizzazione di **{len(df_display)}** righe su **{len(df_original)}** totali")
 
+if ranking_label:
+    st.caption(f"🏆 Prime **{ranking['n']}** righe per **{ranking_label}**")
+    if ranking_excluded:
+        st.warning(f"⚠️ {ranking_excluded} righe escluse dalla classifica perché prive di valore per **{ranking_label}**.")
+
 if not df_display.empty:
-    # Riordina colonne: bloccate all'inizio
-    pinned_cols = []
-    other_cols = []
-    
-    if 'Div' in selected_columns:
-        pinned_cols.append('Div')
-    if 'Nome Mercato' in selected_columns:
-        pinned_cols.append('Nome Mercato')
-    if 'Frequenza Storica' in selected_columns:
-        pinned_cols.append('Frequenza Storica')
-    
-    for col in selected_columns:
-        if col not in pinned_cols:
-            other_cols.append(col)
-    
-    column_order = pinned_cols + other_cols
-    df_display_ordered = df_display[column_order]
-    
     # Applica formattazione
     formatters = {}
     for col in column_order:
         formatters[col] = lambda x, c=col: format_value(x, c)
     
-    styled_df = df_display_ordered.style.apply(
+    styled_df = df_display.style.apply(
         lambda col: [apply_conditional_formatting(val, col.name) for val in col],
         axis=0
     ).format(formatters)
@@ -753,7 +1192,7 @@ if not df_display.empty:
     )
     
     # Opzione per scaricare i risultati
-    csv = df_display.to_csv(index=False).encode('utf-8')
+    csv = df_display.to_csv(index=False, columns=display_columns).encode('utf-8')
     st.download_button(
         label="📥 Scarica Risultati (CSV)",
         data=csv,
@@ -764,6 +1203,110 @@ else:
     # --- MODIFICA QUI ---
     st.warning("Nessun risultato trovato con i filtri applicati.")
 
+# Confronto con la versione precedente dei dati
+st.subheader("🔄 Confronto con la Versione Precedente")
+
+if previous_version is None:
+    st.caption("Nessuna versione precedente disponibile: il confronto sarà attivo dal prossimo aggiornamento di data.xlsx.")
+elif not all(key in columns for key in SNAPSHOT_KEYS):
+    st.caption(f"Il confronto richiede le colonne {' e '.join(SNAPSHOT_KEYS)}.")
+elif st.toggle("Confronta con la versione precedente", key='snapshot_diff_enabled'):
+    df_previous = load_snapshot(previous_version)
+    filter_columns = [
+        filter_config['column']
+        for group in st.session_state.filter_groups
+        for filter_config in group['filters']
+        if filter_config.get('column')
+    ]
+    missing_columns = [col for col in filter_columns + SNAPSHOT_KEYS if df_previous is not None and col not in df_previous.columns]
+    
+    if df_previous is None:
+        pass
+    elif missing_columns:
+        st.warning(f"La versione precedente non contiene le colonne: {', '.join(dict.fromkeys(missing_columns))}")
+    else:
+        # Confronta solo le colonne necessarie e gli indicatori presenti in entrambe le versioni
+        previous_columns = set(df_previous.columns)
+        value_columns = [
+            col for col in columns
+            if col in previous_columns and col not in SNAPSHOT_KEYS
+            and get_column_type(df_original, col) == 'number'
+        ]
+        diff_required = [col for col in columns if col in previous_columns and (col in value_columns or col in SNAPSHOT_KEYS or col in filter_columns)]
+        
+        df_previous_diff = project_columns(df_previous, diff_required)
+        df_current_diff = project_columns(df_original, diff_required)
+        
+        ambiguous_previous = int(ambiguous_key_mask(df_previous_diff).sum())
+        ambiguous_current = int(ambiguous_key_mask(df_current_diff).sum())
+        if ambiguous_previous or ambiguous_current:
+            st.warning(
+                f"⚠️ {ambiguous_current} righe della versione attuale e {ambiguous_previous} della precedente "
+                f"hanno la chiave {' + '.join(SNAPSHOT_KEYS)} mancante o ripetuta e sono escluse dal confronto."
+            )
+        
+        df_diff = compute_snapshot_diff(
+            df_previous_diff,
+            df_current_diff,
+            st.session_state.filter_groups,
+            st.session_state.global_logic,
+            value_columns
+        )
+        
+        status_counts = df_diff['Variazione'].value_counts()
+        metric_cols = st.columns(len(DIFF_STATUSES) - 1)
+        for metric_col, status in zip(metric_cols, DIFF_STATUSES[:-1]):
+            metric_col.metric(status, int(status_counts.get(status, 0)))
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            selected_statuses = st.multiselect(
+                "Tipi di variazione:",
+                options=DIFF_STATUSES,
+                default=DIFF_STATUSES[:-1],
+                key='snapshot_diff_statuses'
+            )
+        with col2:
+            only_matching = st.checkbox(
+                "Solo righe nei filtri",
+                value=bool(st.session_state.filter_groups),
+                key='snapshot_diff_only_matching',
+                help="Mostra solo le righe che soddisfano i filtri nella versione attuale o precedente"
+            )
+        
+        diff_mask = df_diff['Variazione'].isin(selected_statuses).to_numpy()
+        if only_matching:
+            # Con Copy-on-Write to_numpy() restituisce una vista in sola lettura: niente &=
+            diff_mask = diff_mask & (df_diff['Nei filtri (prec.)'].eq(True) | df_diff['Nei filtri'].eq(True)).to_numpy()
+        
+        diff_columns = SNAPSHOT_KEYS + ['Variazione', 'Colonne modificate']
+        if st.session_state.filter_groups:
+            diff_columns += ['Nei filtri (prec.)', 'Nei filtri']
+        diff_columns += [col for col in display_columns if col in value_columns]
+        df_diff_display = df_diff.loc[diff_mask, diff_columns]
+        
+        st.info(f"**{len(df_diff_display)}** variazioni mostrate su **{len(df_diff)}** righe confrontate")
+        
+        if not df_diff_display.empty:
+            diff_formatters = {
+                col: (lambda x, c=col: format_value(x, c))
+                for col in diff_columns if col in value_columns
+            }
+            st.dataframe(
+                df_diff_display.style.format(diff_formatters),
+                use_container_width=True,
+                height=400,
+                hide_index=True
+            )
+            
+            diff_csv = df_diff_display.to_csv(index=False).encode('utf-8')
+            st.download_button(
+                label="📥 Scarica Confronto (CSV)",
+                data=diff_csv,
+                file_name="confronto_versioni.csv",
+                mime="text/csv"
+            )
+
 # Info footer
 st.markdown("---")
 st.caption("💡 **Suggerimento:** I tuoi filtri sono salvati nella sessione e sopravvivono al refresh della pagina. Usa 'Reset Filtri' per ricominciare da zero.")
@@ -0,0 +1,363 @@
+"""Test di carico per l'app Streamlit con sessioni concorrenti simulate.
+
+Avvia `streamlit run app.py` in un processo separato e apre N sessioni
+websocket sullo stesso server, come farebbero N analisti collegati insieme.
+Ogni sessione ripete una sequenza realistica di modifica dei filtri
+(aggiungi gruppo, aggiungi filtro, cambia colonna, modifica valore, download)
+e misura il tempo di ogni rerun fino al messaggio `script_finished`.
+
+Alla fine stampa i percentili di latenza per passo e la memoria (RSS) del
+server per sessione.
+
+Esempio:
+    python load_test.py --sessions 20 --iterations 3
+    python load_test.py --data /percorso/data.xlsx --sessions 50
+
+Usa il protocollo websocket interno di Streamlit: è verificato con
+Streamlit >= 1.66 e richiede `websockets` >= 13 (dipendenza di Streamlit
+nelle versioni recenti, non nella 1.39 ammessa da requirements.txt).
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+try:
+    from websockets.asyncio.client import connect
+except ImportError:
+    sys.exit("Il test di carico richiede websockets >= 13 e Streamlit >= 1.66: "
+             "pip install 'streamlit>=1.66' 'websockets>=13'")
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(PROJECT_DIR, 'app.py')
+
+WIDGET_TYPES = ['button', 'selectbox', 'number_input', 'multiselect',
+                'checkbox', 'radio', 'download_button']
+
+PERCENTILES = [50, 90, 95, 99]
+
+def generate_synthetic_data(file_path, rows, seed=0):
+    """Crea un file Excel con colonne simili a quelle reali (chiave Div + Nome Mercato univoca)"""
+    rng = np.random.default_rng(seed)
+    divisions = ['I1', 'I2', 'E0', 'E1', 'SP1', 'D1', 'F1']
+    markets = ['Over 1.5', 'Over 2.5', 'Under 2.5', 'Gol', 'NoGol', '1X', 'X2']
+    positions = np.arange(rows)
+    market_index = positions // len(divisions)
+    data = {
+        'Div': [divisions[i % len(divisions)] for i in positions],
+        'Nome Mercato': [
+            f"{markets[m % len(markets)]} #{m // len(markets) + 1}" for m in market_index
+        ],
+        'Partite Analizzate': rng.integers(100, 8000, rows),
+        'Frequenza Storica': rng.random(rows),
+        'Quota Equa': 1 + rng.random(rows) * 5,
+        'Ritardo Act': rng.integers(0, 30, rows),
+    }
+    for window in ['MM5', 'MM10', 'MM20', 'MM50', 'EM10', 'EM20']:
+        data[f'{window} Act'] = rng.random(rows)
+        data[f'ZSVal {window}'] = rng.normal(0, 1.5, rows)
+        data[f'ZSDeb {window}'] = rng.normal(0, 1.5, rows)
+        data[f'ZSFz {window}'] = rng.normal(0, 1.5, rows)
+        data[f'MSt {window}'] = rng.random(rows) * 20
+        data[f'LDeb {window}'] = rng.random(rows) * 40
+        data[f'LFz {window}'] = rng.random(rows) * 40
+    pd.DataFrame(data).to_excel(file_path, index=False)
+
+def prepare_workdir(data_file, rows):
+    """Prepara una cartella di lavoro con data.xlsx e la configurazione del progetto"""
+    workdir = tempfile.mkdtemp(prefix='excel_filter_load_')
+    target = os.path.join(workdir, 'data.xlsx')
+
+    if data_file:
+        shutil.copy(data_file, target)
+    else:
+        generate_synthetic_data(target, rows)
+
+    config_dir = os.path.join(PROJECT_DIR, '.streamlit')
+    if os.path.isdir(config_dir):
+        shutil.copytree(config_dir, os.path.join(workdir, '.streamlit'))
+
+    return workdir
+
+def start_server(workdir, port, timeout=60):
+    """Avvia il server Streamlit e attende che risponda all'health check"""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_FILE,
+         '--server.port', str(port), '--server.headless', 'true'],
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Il server Streamlit si è chiuso durante l'avvio")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.25)
+
+    process.terminate()
+    raise RuntimeError(f"Il server Streamlit non risponde sulla porta {port}")
+
+def read_rss_kb(pid):
+    """Legge la memoria residente (VmRSS) di un processo in KB (solo Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+class SimulatedSession:
+    """Una sessione browser simulata collegata al websocket di Streamlit"""
+
+    def __init__(self, port, name):
+        self.port = port
+        self.name = name
+        self.websocket = None
+        self.widgets = {}
+        self.widget_states = {}
+        self.latencies = {}
+        self.errors = []
+
+    async def open(self):
+        self.websocket = await connect(
+            f"ws://127.0.0.1:{self.port}/_stcore/stream",
+            subprotocols=['streamlit'],
+            max_size=None
+        )
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    def find_widget(self, widget_type, key=None, label=None, key_prefix=None):
+        """Cerca un widget dell'ultimo rerun per chiave utente o etichetta"""
+        matches = []
+        for widget_id, (w_type, widget) in self.widgets.items():
+            if w_type != widget_type:
+                continue
+            if key is not None and widget_id.endswith(f"-{key}"):
+                matches.append(widget)
+            elif key_prefix is not None and f"-{key_prefix}" in widget_id:
+                matches.append(widget)
+            elif label is not None and widget.label == label:
+                matches.append(widget)
+        return matches[-1] if matches else None
+
+    async def rerun(self, step, trigger=None):
+        """Invia un rerun con lo stato dei widget e misura il tempo fino alla fine dello script"""
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.page_script_hash = ''
+        for state in self.widget_states.values():
+            message.rerun_script.widget_states.widgets.append(state)
+        if trigger is not None:
+            message.rerun_script.widget_states.widgets.append(
+                WidgetState(id=trigger, trigger_value=True)
+            )
+
+        widgets = {}
+        start = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.websocket.recv())
+            msg_type = forward.WhichOneof('type')
+
+            if msg_type == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    widgets[widget.id] = (element_type, widget)
+                elif element_type == 'exception':
+                    self.errors.append(f"{step}: {element.exception.message}")
+
+            elif msg_type == 'script_finished':
+                status = forward.script_finished
+                # Dopo st.rerun() lo script riparte: si attende la fine dell'ultima esecuzione
+                if status == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    widgets = {}
+                    continue
+                if status == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.errors.append(f"{step}: errore di compilazione")
+                break
+
+        self.latencies.setdefault(step, []).append(time.perf_counter() - start)
+        self.widgets = widgets
+        # Gli stati dei widget non più presenti non vanno reinviati
+        self.widget_states = {
+            widget_id: state for widget_id, state in self.widget_states.items()
+            if widget_id in widgets
+        }
+
+    async def click(self, step, button):
+        if button is None:
+            self.errors.append(f"{step}: pulsante non trovato")
+            return
+        await self.rerun(step, trigger=button.id)
+
+    async def set_value(self, step, widget, **value):
+        if widget is None:
+            self.errors.append(f"{step}: widget non trovato")
+            return
+        self.widget_states[widget.id] = WidgetState(id=widget.id, **value)
+        await self.rerun(step)
+
+    async def download(self, step):
+        """Scarica il CSV dei risultati come farebbe il browser"""
+        button = self.find_widget('download_button', label="📥 Scarica Risultati (CSV)")
+        if button is None:
+            # Nessun risultato: il pulsante non è presente
+            return
+        url = f"http://127.0.0.1:{self.port}{button.url}"
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(lambda: urllib.request.urlopen(url, timeout=60).read())
+        except OSError as e:
+            self.errors.append(f"{step}: {e}")
+            return
+        self.latencies.setdefault(step, []).append(time.perf_counter() - start)
+
+    async def run_scenario(self, iterations, think_time, rng):
+        """Replica una sequenza di modifica dei filtri"""
+        await self.open()
+        try:
+            await self.rerun('apertura')
+
+            for _ in range(iterations):
+                await asyncio.sleep(think_time)
+                await self.click('aggiungi_gruppo', self.find_widget('button', label="➕ Aggiungi Gruppo"))
+
+                await asyncio.sleep(think_time)
+                await self.click('aggiungi_filtro', self.find_widget('button', key_prefix='add_filter_'))
+
+                await asyncio.sleep(think_time)
+                column_box = self.find_widget('selectbox', key_prefix='filter_col_')
+                if column_box is not None:
+                    indicators = [opt for opt in column_box.options if opt.startswith('ZS')]
+                    column = rng.choice(indicators or list(column_box.options))
+                    await self.set_value('cambia_colonna', column_box, string_value=column)
+
+                await asyncio.sleep(think_time)
+                value_input = self.find_widget('number_input', key_prefix='filter_val_')
+                if value_input is not None:
+                    threshold = round(rng.uniform(-1.0, 2.5), 2)
+                    await self.set_value('modifica_valore', value_input, double_value=threshold)
+
+                await asyncio.sleep(think_time)
+                await self.download('download')
+
+            await self.click('reset', self.find_widget('button', label="🔄 Reset Filtri"))
+        except Exception as e:
+            self.errors.append(f"{self.name}: {e!r}")
+
+async def run_sessions(port, sessions, iterations, think_time, ramp, seed, server_pid=None):
+    """Esegue tutte le sessioni in parallelo e misura la memoria con le sessioni ancora aperte"""
+    simulated = [SimulatedSession(port, f"sessione-{i + 1}") for i in range(sessions)]
+
+    async def start(index, session):
+        await asyncio.sleep(ramp * index / max(sessions, 1))
+        await session.run_scenario(iterations, think_time, random.Random(seed + index))
+
+    try:
+        await asyncio.gather(*(start(i, s) for i, s in enumerate(simulated)))
+        rss = read_rss_kb(server_pid) if server_pid else None
+    finally:
+        await asyncio.gather(*(s.close() for s in simulated))
+    return simulated, rss
+
+def print_report(simulated, elapsed, rss_baseline, rss_after):
+    """Stampa percentili di latenza per passo e memoria per sessione"""
+    steps = {}
+    for session in simulated:
+        for step, values in session.latencies.items():
+            steps.setdefault(step, []).extend(values)
+
+    header = f"{'passo':<18}{'n':>6}" + ''.join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'max':>10}"
+    print(header)
+    print('-' * len(header))
+
+    all_values = []
+    for step, values in steps.items():
+        all_values.extend(values)
+        ms = np.array(values) * 1000
+        row = f"{step:<18}{len(ms):>6}" + ''.join(f"{np.percentile(ms, p):>10.0f}" for p in PERCENTILES)
+        print(row + f"{ms.max():>10.0f}")
+
+    if all_values:
+        ms = np.array(all_values) * 1000
+        row = f"{'totale':<18}{len(ms):>6}" + ''.join(f"{np.percentile(ms, p):>10.0f}" for p in PERCENTILES)
+        print('-' * len(header))
+        print(row + f"{ms.max():>10.0f}")
+
+    print(f"\nLatenze in ms. Durata complessiva: {elapsed:.1f} s, "
+          f"{len(all_values) / elapsed:.1f} operazioni/s")
+
+    if rss_baseline is not None and rss_after is not None:
+        per_session = (rss_after - rss_baseline) / max(len(simulated), 1)
+        print(f"Memoria server: {rss_baseline / 1024:.1f} MB a riposo, {rss_after / 1024:.1f} MB con "
+              f"{len(simulated)} sessioni ({per_session / 1024:.2f} MB per sessione)")
+
+    errors = [error for session in simulated for error in session.errors]
+    if errors:
+        print(f"\n{len(errors)} errori:")
+        for error in errors[:20]:
+            print(f"  {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico con sessioni Streamlit concorrenti")
+    parser.add_argument('--sessions', type=int, default=10, help="Numero di sessioni concorrenti")
+    parser.add_argument('--iterations', type=int, default=3, help="Ripetizioni della sequenza per sessione")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Pausa in secondi tra un'azione e l'altra")
+    parser.add_argument('--ramp', type=float, default=0.0, help="Secondi per avviare gradualmente tutte le sessioni")
+    parser.add_argument('--port', type=int, default=18501, help="Porta del server di test")
+    parser.add_argument('--data', help="File Excel da usare (default: dati sintetici)")
+    parser.add_argument('--rows', type=int, default=3000, help="Righe dei dati sintetici")
+    parser.add_argument('--seed', type=int, default=0, help="Seed per le scelte casuali delle sessioni")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir(args.data, args.rows)
+    server = start_server(workdir, args.port)
+
+    try:
+        # Una sessione di riscaldamento carica i dati nella cache prima della misura
+        asyncio.run(run_sessions(args.port, 1, 1, 0.0, 0.0, args.seed))
+        rss_baseline = read_rss_kb(server.pid)
+
+        start = time.perf_counter()
+        simulated, rss_after = asyncio.run(run_sessions(
+            args.port, args.sessions, args.iterations, args.think_time, args.ramp, args.seed,
+            server_pid=server.pid
+        ))
+        elapsed = time.perf_counter() - start
+
+        print_report(simulated, elapsed, rss_baseline, rss_after)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
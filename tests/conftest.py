@@ -0,0 +1,27 @@
+import ast
+import os
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Funzioni e costanti di app.py, senza eseguire l'interfaccia Streamlit"""
+    with open(APP_FILE, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+
+    def is_constant(node):
+        return isinstance(node, ast.Assign) and all(
+            isinstance(target, ast.Name) and target.id.isupper() for target in node.targets
+        )
+
+    body = [node for node in tree.body if isinstance(node, ast.FunctionDef) or is_constant(node)]
+    namespace = {'st': st, 'pd': pd, 'np': np, 'os': os}
+    exec(compile(ast.Module(body=body, type_ignores=[]), APP_FILE, 'exec'), namespace)
+    return types.SimpleNamespace(**namespace)
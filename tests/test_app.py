@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def make_data(rows=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Div': [f'D{i % 3}' for i in range(rows)],
+        'Nome Mercato': [f'Mercato {i}' for i in range(rows)],
+        'Partite Analizzate': rng.integers(100, 5000, rows),
+        'Frequenza Storica': rng.random(rows),
+        'ZSDeb MM5': rng.normal(0, 1.5, rows),
+        'ZSVal MM50': rng.normal(0, 1.5, rows),
+    })
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    yield tmp_path
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def run_app():
+    at = AppTest.from_file(APP_FILE, default_timeout=60).run()
+    assert not at.exception
+    return at
+
+
+def test_ranking_widgets_keep_every_edit(workdir):
+    make_data().to_excel('data.xlsx', index=False)
+    at = run_app()
+
+    at.checkbox(key='ranking_enabled').check().run()
+    at.number_input(key='ranking_n').set_value(20).run()
+    at.number_input(key='ranking_n').set_value(30).run()
+    assert at.session_state.ranking['n'] == 30
+
+    at.radio(key='ranking_direction').set_value('asc').run()
+    at.radio(key='ranking_direction').set_value('abs').run()
+    assert at.session_state.ranking['direction'] == 'abs'
+
+    at.selectbox(key='ranking_column').set_value('__composite__').run()
+    at.multiselect(key='ranking_weighted_columns').set_value(['ZSDeb MM5']).run()
+    at.multiselect(key='ranking_weighted_columns').set_value(['ZSDeb MM5', 'ZSVal MM50']).run()
+    assert not at.exception
+    assert at.session_state.ranking['weights'] == {'ZSDeb MM5': 1.0, 'ZSVal MM50': 1.0}
+    assert at.dataframe[0].value.shape[0] == 30
+
+
+def replace_data(df):
+    # La versione del file dipende da data di modifica e dimensione
+    stat = os.stat('data.xlsx')
+    df.to_excel('data.xlsx', index=False)
+    os.utime('data.xlsx', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def add_filter(at, column, value):
+    next(b for b in at.sidebar.button if b.label == "➕ Aggiungi Gruppo").click().run()
+    at.button(key='add_filter_0').click().run()
+    at.selectbox(key='filter_col_0_0').set_value(column).run()
+    at.selectbox(key='filter_cond_0_0').set_value('>=').run()
+    at.number_input(key='filter_val_0_0').set_value(value).run()
+
+
+def test_snapshot_diff_with_active_filters_only_matching(workdir):
+    previous = make_data()
+    previous.loc[0, 'ZSDeb MM5'] = 0.0
+    previous.loc[1, 'ZSDeb MM5'] = 3.0
+    previous.to_excel('data.xlsx', index=False)
+    run_app()
+
+    current = previous.iloc[:-1].copy()
+    current.loc[0, 'ZSDeb MM5'] = 2.5
+    current.loc[1, 'ZSDeb MM5'] = 0.5
+    replace_data(current)
+
+    at = run_app()
+    add_filter(at, 'ZSDeb MM5', 2.0)
+    at.toggle(key='snapshot_diff_enabled').set_value(True).run()
+    assert not at.exception
+    assert at.checkbox(key='snapshot_diff_only_matching').value
+
+    diff = at.dataframe[-1].value.set_index('Nome Mercato')
+    assert diff.loc['Mercato 0', 'Variazione'] == 'Entrata nel filtro'
+    assert diff.loc['Mercato 1', 'Variazione'] == 'Uscita dal filtro'
+    matching = diff['Nei filtri (prec.)'].eq(True) | diff['Nei filtri'].eq(True)
+    assert matching.all()
+
+
+def test_snapshot_diff_warns_about_duplicate_keys(workdir):
+    previous = make_data()
+    previous.to_excel('data.xlsx', index=False)
+    run_app()
+
+    current = previous.copy()
+    current.loc[1, 'Nome Mercato'] = 'Mercato 0'
+    current.loc[1, 'Div'] = current.loc[0, 'Div']
+    replace_data(current)
+
+    at = run_app()
+    at.toggle(key='snapshot_diff_enabled').set_value(True).run()
+    assert not at.exception
+    assert any('2 righe della versione attuale' in w.value for w in at.warning)
+
+
+def test_composite_ranking_reports_rows_without_score(workdir):
+    df = make_data()
+    df.loc[[3, 7, 11], 'ZSVal MM50'] = np.nan
+    df.to_excel('data.xlsx', index=False)
+    at = run_app()
+
+    at.checkbox(key='ranking_enabled').check().run()
+    at.selectbox(key='ranking_column').set_value('__composite__').run()
+    at.multiselect(key='ranking_weighted_columns').set_value(['ZSDeb MM5', 'ZSVal MM50']).run()
+    at.number_input(key='ranking_n').set_value(100).run()
+    assert not at.exception
+
+    assert any('3 righe escluse' in w.value for w in at.warning)
+    assert at.dataframe[0].value.shape[0] == len(df) - 3
+
+
+def test_snapshot_diff_with_mixed_type_text_column(workdir):
+    previous = make_data(rows=4)
+    previous['PQS'] = pd.Series([1, 'Alto', 2, 'Basso'], dtype=object)
+    previous.to_excel('data.xlsx', index=False)
+    at = run_app()
+    assert not any('Impossibile salvare' in w.value for w in at.warning)
+
+    current = previous.copy()
+    current.loc[0, 'ZSDeb MM5'] = 10.0
+    replace_data(current)
+
+    at = run_app()
+    assert not any('Impossibile salvare' in w.value for w in at.warning)
+    at.toggle(key='snapshot_diff_enabled').set_value(True).run()
+    assert not at.exception
+
+    diff = at.dataframe[-1].value.set_index('Nome Mercato')
+    assert diff.loc['Mercato 0', 'Variazione'] == 'Valori modificati'
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+OPERATORS = ['>', '<', '>=', '<=', '=']
+
+
+def formatted(app, series):
+    return [app.format_value(value, series.name) for value in series.tolist()]
+
+
+def test_downcast_dtypes_chooses_compact_types(app):
+    rows = 200
+    df = pd.DataFrame({
+        'Div': ['I1', 'E0'] * (rows // 2),
+        'Nome Mercato': [f'Mercato {i}' for i in range(rows)],
+        'Partite Analizzate': np.arange(rows) + 100,
+        'Conteggio Grande': np.arange(rows) + 100_000,
+        'Conteggio Enorme': np.arange(rows) + 2**40,
+        'ZSDeb MM5': np.linspace(-3, 3, rows).round(2),
+    })
+
+    downcast = app.downcast_dtypes(df)
+
+    assert downcast['Div'].dtype == 'category'
+    # Testo con molti valori distinti: nessun vantaggio dalla categoria
+    assert downcast['Nome Mercato'].dtype != 'category'
+    assert downcast['Partite Analizzate'].dtype == np.int16
+    assert downcast['Conteggio Grande'].dtype == np.int32
+    assert downcast['Conteggio Enorme'].dtype == np.int64
+    assert downcast['ZSDeb MM5'].dtype == np.float32
+
+
+def test_downcast_dtypes_keeps_display_and_filters(app):
+    rng = np.random.default_rng(0)
+    rows = 3000
+    df = pd.DataFrame({
+        'Div': rng.choice(['I1', 'E0', 'SP1'], rows),
+        'Partite Analizzate': rng.integers(100, 5000, rows),
+        'Frequenza Storica': rng.random(rows).round(4),
+        'Quota Equa': (1 / rng.uniform(0.1, 1, rows)).round(2),
+        'ZSDeb MM5': rng.normal(0, 1.5, rows).round(3),
+        'ZSVal MM50': rng.normal(0, 1.5, rows),
+        'MSt MM10': rng.random(rows) * 20,
+    })
+    df.loc[::50, 'ZSVal MM50'] = np.nan
+
+    downcast = app.downcast_dtypes(df)
+
+    for col in df.columns:
+        assert formatted(app, df[col]) == formatted(app, downcast[col]), col
+
+    for col in ['Quota Equa', 'ZSDeb MM5', 'ZSVal MM50', 'MSt MM10']:
+        # Soglie a due decimali, comprese quelle che coincidono con valori del file
+        data_thresholds = np.unique(df[col].dropna().round(2))[::5]
+        for threshold in np.union1d(np.round(np.arange(-5, 12, 0.1), 2), data_thresholds):
+            for condition in OPERATORS:
+                expected = app.apply_single_filter(df, col, condition, threshold)
+                actual = app.apply_single_filter(downcast, col, condition, threshold)
+                assert np.array_equal(expected, actual), (col, condition, threshold)
+
+
+def test_downcast_column_falls_back_when_rounding_changes(app):
+    # 1.355 in float64 è appena sotto il 5 finale, in float32 appena sopra
+    series = pd.Series([1.355, -1.115, 0.5], name='ZSDeb MM5')
+    assert app.format_value(np.float32(1.355).item(), 'ZSDeb MM5') != app.format_value(1.355, 'ZSDeb MM5')
+    assert app.downcast_column(series).dtype == np.float64
+
+    # Colonne mostrate con str(): qualsiasi valore non esatto in float32 è visibile
+    assert app.downcast_column(pd.Series([1.1, 2.2], name='PQS')).dtype == np.float64
+    assert app.downcast_column(pd.Series([1.5, 2.25], name='PQS')).dtype == np.float32
+
+
+def stable_top_n(values, n, direction):
+    """Riferimento: ordinamento stabile completo delle righe con punteggio"""
+    keys = np.abs(values) if direction == 'abs' else values
+    keys = keys if direction == 'asc' else -keys
+    valid = np.flatnonzero(~np.isnan(keys))
+    return valid[np.argsort(keys[valid], kind='stable')][:n]
+
+
+def test_rank_top_n_matches_stable_sort_with_ties_and_nan(app):
+    rng = np.random.default_rng(0)
+    for case in range(300):
+        rows = int(rng.integers(1, 40))
+        # Pochi valori interi (come Ritardo Act) per avere molti pari merito
+        values = rng.integers(-4, 5, rows).astype(np.float64)
+        values[rng.random(rows) < 0.2] = np.nan
+        df = pd.DataFrame({'valore': values}, index=np.arange(rows) * 10)
+
+        for direction in ['desc', 'asc', 'abs']:
+            for n in [1, 3, rows // 2, rows, rows + 5]:
+                expected = stable_top_n(values, n, direction)
+                actual = app.rank_top_n(df, values, n, direction)
+                assert actual.index.tolist() == df.index[expected].tolist(), (case, direction, n)
+
+
+def test_rank_top_n_empty_cases(app):
+    df = pd.DataFrame({'valore': [np.nan, np.nan]})
+    assert app.rank_top_n(df, df['valore'].to_numpy(), 5, 'desc').empty
+    assert app.rank_top_n(df, np.array([1.0, 2.0]), 0, 'desc').empty